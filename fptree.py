@@ -25,6 +25,9 @@ Conditional pattern base is a sub-database consisting of prefix paths in the FP
 
 #8) Frequent Patterns are generated from the Conditional FP Tree.
 """
+import pickle as pkl
+import sys
+import tempfile
 from collections import defaultdict
 from itertools import combinations
 
@@ -54,6 +57,9 @@ class Tree:
     def get_branches_from_leaf(self):
         return self.root.get_branches_from_leaf()
 
+    def iter_branches_reversed(self, with_counts=False):
+        return self.root.iter_branches_from_leaf(with_counts=with_counts)
+
 
 class Node:
     def __init__(self, item, count, parent=None):
@@ -111,6 +117,14 @@ class Node:
                 branches.extend(node.get_branches_from_leaf(with_counts=with_counts))
         return branches
 
+    def iter_branches_from_leaf(self, with_counts=False):
+        # same order as get_branches_from_leaf, but one branch at a time
+        for node in self.nodes.values():
+            if len(node.nodes) == 0:
+                yield node.get_branch(with_counts=with_counts)
+            else:
+                yield from node.iter_branches_from_leaf(with_counts=with_counts)
+
     def get_branch(self, with_counts=False):
         branch = []
         node = self
@@ -179,6 +193,68 @@ def build_conditionals(tree, min_support_count=2):
     return conditional_trees
 
 
+def get_branch_size(branch):
+    # rough in-memory footprint of a conditional pattern base entry (item strings are shared with the tree)
+    return sys.getsizeof(branch) + sum(sys.getsizeof(pair) for pair in branch)
+
+
+def iter_conditionals(tree, min_support_count=2, memory_budget=64 * 1024 * 1024):
+    """
+    Memory-budgeted build_conditionals: yields (item, conditional_tree) one suffix at a time instead of building
+    every conditional tree up front. The caller should mine each tree and drop its reference to it before asking for
+    the next one (get_frequent_patterns does), so only one conditional tree is alive at a time.
+
+    Conditional pattern bases are gathered in one pass over the tree. Whenever the bases held in memory exceed
+    memory_budget bytes, the largest ones are appended to a spill file until they are back under half the budget, and
+    a spilled suffix's tree is later built by reading its chunks back. Branch order per suffix is kept, so the trees
+    match build_conditionals.
+
+    memory_budget only caps the bases held while gathering. Each conditional tree, spilled or not, is still built in
+    full in memory before it is mined, so peak memory is roughly memory_budget plus the largest single conditional
+    tree, not memory_budget alone.
+    """
+    with tempfile.TemporaryFile(prefix='fptree_') as spill_file:
+        bases = {}
+        base_sizes = {}
+        partitions = defaultdict(list)  # item -> offsets of its spilled chunks in spill_file, in branch order
+        in_memory_size = 0
+        for branch in tree.iter_branches_reversed(with_counts=True):
+            item = branch[0][0]
+            if item not in bases:
+                bases[item] = []
+                base_sizes[item] = 0
+            bases[item].append(branch[1:])
+            branch_size = get_branch_size(branch[1:])
+            base_sizes[item] += branch_size
+            in_memory_size += branch_size
+
+            if in_memory_size > memory_budget:
+                # spill largest bases first, down to half the budget, so spills stay rare
+                for spill_item in sorted(base_sizes, key=base_sizes.get, reverse=True):
+                    if in_memory_size <= memory_budget // 2:
+                        break
+                    if not bases[spill_item]:
+                        continue
+                    partitions[spill_item].append(spill_file.tell())
+                    pkl.dump(bases[spill_item], spill_file, protocol=pkl.HIGHEST_PROTOCOL)
+                    in_memory_size -= base_sizes[spill_item]
+                    bases[spill_item] = []
+                    base_sizes[spill_item] = 0
+
+        for item in list(bases):
+            conditional_tree = Tree(None)
+            for offset in partitions.pop(item, ()):
+                spill_file.seek(offset)
+                for branch in pkl.load(spill_file):
+                    conditional_tree.add_transaction(branch, with_counts=True)
+            for branch in bases.pop(item):
+                conditional_tree.add_transaction(branch, with_counts=True)
+            del base_sizes[item]
+
+            conditional_tree.prune(min_support_count=min_support_count)
+            yield item, conditional_tree
+
+
 def get_itemcounts_tree(tree):
     itemcounts = defaultdict(int)
     # print(tree)
@@ -205,10 +281,12 @@ I4	{I2,I1,I3:1},{I2,I3:1}	{I2:2, I3:2}	{I2,I4:2},{I3,I4:2},{I2,I3,I4:2}
 I3	{I2,I1:3},{I2:1}	{I2:4, I1:3}	{I2,I3:4}, {I1:I3:3}, {I2,I1,I3:3}
 I1	{I2:4}	{I2:4}	{I2,I1:4}
 """
+    # conditional_trees is either the dict from build_conditionals or the (item, tree) stream from iter_conditionals
+    if isinstance(conditional_trees, dict):
+        conditional_trees = conditional_trees.items()
     frequent_patterns = []
-    for base_item in conditional_trees:
-        if len(conditional_trees[base_item].root.nodes) == 0: continue
-        conditional_tree = conditional_trees[base_item]
+    for base_item, conditional_tree in conditional_trees:
+        if len(conditional_tree.root.nodes) == 0: continue
         conditional_itemcounts = get_itemcounts_tree(conditional_tree)
         #print(base_item,conditional_itemcounts)
         # generate all combinations of itemsets from conditional_itemcounts and item, with the lowest itemcount as the support for that itemset combination
@@ -226,13 +304,24 @@ I1	{I2:4}	{I2:4}	{I2,I1:4}
         itemsets = [(itemset, count) for itemset, count in itemsets if count > min_support_count]
         # add to frequent patterns
         frequent_patterns += itemsets
+        # let iter_conditionals free this tree before it builds the next one
+        del conditional_tree, conditional_itemcounts
     return frequent_patterns
 
 
-def get_fptree_frequent_itemsets(transactions, min_support_count_tree=2, min_support_count_pattern=2, k=3):
+def get_fptree_frequent_itemsets(transactions, min_support_count_tree=2, min_support_count_pattern=2, k=3,
+                                 memory_budget=None):
+    # with a memory_budget (bytes), conditional trees are built, mined and released one suffix at a time and
+    # conditional_trees is returned as None
     tree = build_tree(transactions, min_support_count=min_support_count_tree)
-    conditional_trees = build_conditionals(tree, min_support_count=min_support_count_tree)
+    if memory_budget is None:
+        conditional_trees = build_conditionals(tree, min_support_count=min_support_count_tree)
+    else:
+        conditional_trees = iter_conditionals(tree, min_support_count=min_support_count_tree,
+                                              memory_budget=memory_budget)
     frequent_patterns = get_frequent_patterns(conditional_trees, k=k, min_support_count=min_support_count_pattern)
+    if memory_budget is not None:
+        conditional_trees = None
     frequent_patterns = pd.DataFrame(frequent_patterns, columns=['itemset', 'support_count'])
     frequent_patterns = frequent_patterns.groupby('itemset').agg({'support_count': 'sum'}).sort_values('support_count',
                                                                                              ascending=False).reset_index()
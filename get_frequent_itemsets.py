@@ -88,6 +88,8 @@ if __name__ == "__main__":
         # print(result)
         t2 = time.time()
         print(f"Calculation complete. Time elapsed: {t2 - t1:.2f} seconds.")
+        # itemsets.pkl is what serve.py loads (or hot-reloads) into its rule index
+        pkl.dump(result, open('itemsets.pkl', 'wb'))
         from display import display_frequent_itemsets, visualize_support_by_itemset_size
 
         print("Displaying...")
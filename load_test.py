@@ -0,0 +1,75 @@
+"""
+Load-test client for serve.py. Opens a number of concurrent connections, each sending random baskets back to back,
+and reports throughput and latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import pickle as pkl
+import random
+import time
+
+
+async def run_connection(host, port, baskets, n_requests, k, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(n_requests):
+        request = json.dumps({'basket': random.choice(baskets), 'k': k}).encode() + b'\n'
+        t1 = time.perf_counter()
+        writer.write(request)
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.perf_counter() - t1)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def reload_periodically(host, port, reload_every):
+    # keeps hot-reloading the server's index so latency can be measured while a reload is in flight
+    reader, writer = await asyncio.open_connection(host, port)
+    n_reloads = 0
+    try:
+        while True:
+            await asyncio.sleep(reload_every)
+            writer.write(b'{"reload": true}\n')
+            await writer.drain()
+            await reader.readline()
+            n_reloads += 1
+    finally:
+        writer.close()
+        print(f"{n_reloads} reloads completed during the test")
+
+
+async def load_test(host, port, baskets, connections=16, requests_per_connection=1000, k=5, reload_every=None):
+    latencies = []
+    reloader = asyncio.create_task(reload_periodically(host, port, reload_every)) if reload_every else None
+    t1 = time.perf_counter()
+    await asyncio.gather(*[run_connection(host, port, baskets, requests_per_connection, k, latencies)
+                           for _ in range(connections)])
+    t2 = time.perf_counter()
+    if reloader is not None:
+        reloader.cancel()
+        await asyncio.gather(reloader, return_exceptions=True)
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e6
+    print(f"{len(latencies)} requests in {t2 - t1:.2f} seconds ({len(latencies) / (t2 - t1):.0f} requests per second)")
+    print(f"latency (us): p50 {percentile(0.50):.0f}, p90 {percentile(0.90):.0f}, p99 {percentile(0.99):.0f}, "
+          f"max {latencies[-1] * 1e6:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('transactions', nargs='?', default='transactions.pkl')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per connection')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--reload-every', type=float, default=None, help='seconds between hot reloads')
+    args = parser.parse_args()
+
+    # baskets are sampled from real transactions so queries hit the index the way storefront traffic would
+    transactions = pkl.load(open(args.transactions, 'rb'))
+    baskets = [random.sample(list(transaction), min(len(transaction), random.randint(1, 3)))
+               for transaction in random.sample(list(transactions), min(1000, len(transactions)))]
+    asyncio.run(load_test(args.host, args.port, baskets, args.connections, args.requests, args.k,
+                           args.reload_every))